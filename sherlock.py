@@ -1,16 +1,36 @@
+import atexit
+import argparse
 import logging
+import logging.handlers
+import mmap
 import os
+import queue
+import random
 import sys
+import tempfile
+import textwrap
 import uuid
 import re
 import json
+import selectors
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from types import MappingProxyType
 from dotenv import load_dotenv
 
+# orjson is optional: it serializes/parses in native code, the stdlib json module is used otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Import our custom LLM handler and helper functions
 # Make sure sherlock_llm_handler.py and sherlock_system_prompt.txt are accessible
 try:
-    from sherlock_llm_handler import SherlockLLMHandler, extract_case_title, extract_key_elements
+    from sherlock_llm_handler import (
+        SherlockLLMHandler, extract_case_title, extract_key_elements, add_case_elements,
+        summarize_initial_scene
+    )
 except ImportError:
     print("Error: Could not import 'sherlock_llm_handler'. Make sure the file exists and is in the Python path.")
     sys.exit(1)
@@ -18,11 +38,22 @@ except ImportError:
 # --- Configuration ---
 load_dotenv() # Load environment variables from .env file (especially NEBIUS_API_KEY)
 
+# Read-only snapshot of the environment settings, taken once at startup
+CONFIG = MappingProxyType({
+    'NEBIUS_API_KEY': os.environ.get("NEBIUS_API_KEY"),
+    'MODEL': os.environ.get("SHERLOCK_MODEL", "mistralai/Mixtral-8x7B-Instruct-v0.1"),
+})
+
 # --- Directories ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SAVE_DIR = os.path.join(BASE_DIR, 'data', 'saved_games')
 LOG_DIR = os.path.join(BASE_DIR, 'logs')
 PROMPTS_DIR = os.path.join(BASE_DIR, 'prompts')
+# Small metadata index of all saves, so the load menu doesn't have to parse every save file
+SAVE_INDEX_FILENAME = '_index.json'
+SAVE_INDEX_PATH = os.path.join(SAVE_DIR, SAVE_INDEX_FILENAME)
+# Prefix for building save file paths by plain concatenation (save filenames never contain separators)
+_SAVE_DIR_PREFIX = SAVE_DIR + os.sep
 
 os.makedirs(SAVE_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -30,14 +61,24 @@ os.makedirs(PROMPTS_DIR, exist_ok=True) # Ensure prompts dir exists
 
 # --- Logging ---
 log_file_path = os.path.join(LOG_DIR, 'terminal_game.log')
+# Records are only queued by the game thread; a background listener formats and writes them
+_log_file_handler = logging.FileHandler(log_file_path)
+_log_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+_LOG_QUEUE = queue.SimpleQueue()
+_LOG_LISTENER = logging.handlers.QueueListener(
+    _LOG_QUEUE,
+    _log_file_handler,
+    # logging.StreamHandler() # Uncomment to also log to console
+)
 logging.basicConfig(
     level=logging.INFO, # Change to logging.DEBUG for more verbose LLM prompts/responses
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file_path),
-        # logging.StreamHandler() # Uncomment to also log to console
-    ]
+    format='%(message)s', # Only merges the args (and traceback) into the message, the listener adds the rest
+    handlers=[logging.handlers.QueueHandler(_LOG_QUEUE)]
 )
+_LOG_LISTENER.start()
+# Registered before the save writer's shutdown hook, so it runs after it (atexit is LIFO) and
+# messages logged by the last queued saves are still written
+atexit.register(_LOG_LISTENER.stop)
 logging.info("Terminal game started.")
 
 # --- System Prompt ---
@@ -131,38 +172,170 @@ if not SHERLOCK_SYSTEM_PROMPT_TEMPLATE:
     print(f"Please ensure '{os.path.join(PROMPTS_DIR, 'sherlock_system_prompt.txt')}' exists or can be created.")
     sys.exit(1)
 
+# Whether identical LLM requests may be answered from the on-disk response cache (--no-cache disables it)
+LLM_CACHE_ENABLED = True
+
 # --- LLM Handler ---
 # Check for API Key before initializing
-if not os.environ.get("NEBIUS_API_KEY"):
+if not CONFIG['NEBIUS_API_KEY']:
     print("CRITICAL ERROR: NEBIUS_API_KEY environment variable not set.")
     print("Please set the API key in a .env file or your system environment.")
     sys.exit(1)
 
-try:
-    # Initialize LLM handler (pass the template, genre will be filled later)
-    llm_handler = SherlockLLMHandler(SHERLOCK_SYSTEM_PROMPT_TEMPLATE, default_model="mistralai/Mixtral-8x7B-Instruct-v0.1")
-except Exception as e:
-    print(f"CRITICAL ERROR: Failed to initialize LLM Handler: {e}")
-    logging.critical(f"LLM Handler initialization failed: {e}", exc_info=True)
-    sys.exit(1)
+# Created on first use, so the main menu comes up without waiting for the openai import
+_LLM_HANDLER = None
 
+def get_llm_handler():
+    """Return the shared LLM handler, initializing it on the first call"""
+    global _LLM_HANDLER
+    if _LLM_HANDLER is None:
+        try:
+            # Initialize LLM handler (pass the template, genre will be filled later)
+            _LLM_HANDLER = SherlockLLMHandler(SHERLOCK_SYSTEM_PROMPT_TEMPLATE, default_model=CONFIG['MODEL'], api_key=CONFIG['NEBIUS_API_KEY'])
+        except Exception as e:
+            print(f"CRITICAL ERROR: Failed to initialize LLM Handler: {e}")
+            logging.critical(f"LLM Handler initialization failed: {e}", exc_info=True)
+            sys.exit(1)
+    return _LLM_HANDLER
 
-# --- Game State Management ---
 
-def save_game_state(game_state):
-    """Save the game state to a JSON file"""
-    game_id = game_state.get('game_id')
-    if not game_id:
-        logging.error("Attempted to save game state without a game_id.")
-        return None # Cannot save without an ID
-
-    # Update last_updated timestamp
-    game_state['last_updated'] = datetime.now().isoformat()
+# --- Game State Management ---
 
+# Save files are written by a single background thread so saving never blocks the game loop.
+# Shutdown waits for queued writes, so nothing is lost when the game exits.
+_SAVE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='save-writer')
+atexit.register(_SAVE_EXECUTOR.shutdown, wait=True)
+# Future of the most recently queued write, so fire-and-forget saves can report a failure later
+_LAST_SAVE_FUTURE = None
+
+# Below this size a plain read() is cheaper than setting up a memory map
+_MMAP_MIN_SIZE = 64 * 1024
+
+# Characters stripped from case titles to make them filename-friendly
+_TITLE_SANITIZE_RE = re.compile(r'[^\w\s-]')
+# Canonical UUID string, as produced by str(uuid.uuid4()) for game ids
+_UUID_RE = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+def _dump_json_bytes(data):
+    """Serialize data to indented UTF-8 JSON bytes (orjson if available)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode('utf-8')
+
+def _load_json_bytes(raw):
+    """Parse JSON from bytes (orjson if available). Raises json.JSONDecodeError on bad input."""
+    if orjson is not None:
+        return orjson.loads(raw) # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    return json.loads(raw)
+
+def _read_json_file(path):
+    """
+    Parse a JSON file. Large files are memory-mapped and parsed by orjson in place,
+    which avoids copying the whole file into a bytes object first.
+    """
+    with open(path, 'rb') as f:
+        if orjson is None or os.fstat(f.fileno()).st_size < _MMAP_MIN_SIZE:
+            return _load_json_bytes(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view: # Must be released before the map is closed
+                return _load_json_bytes(view)
+
+# NamedTemporaryFile creates files with mode 0600; saves get the usual umask-based mode instead
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+_SAVE_FILE_MODE = 0o666 & ~_UMASK
+
+def _write_file_atomic(path, data):
+    """Write bytes to path via a uniquely named, fsynced temp file and an atomic rename"""
+    directory, basename = os.path.split(path)
+    # A unique temp name per write, so concurrent saves of the same file can't collide
+    temp_file = tempfile.NamedTemporaryFile('wb', dir=directory, prefix=basename + '.', suffix='.tmp', delete=False)
+    try:
+        with temp_file:
+            temp_file.write(data) # The whole buffer in a single write
+            temp_file.flush()
+            os.fsync(temp_file.fileno()) # Make sure the data is on disk before it replaces the old file
+        os.chmod(temp_file.name, _SAVE_FILE_MODE) # The rename keeps the temp file's mode
+        os.replace(temp_file.name, path) # Atomic rename/replace
+    except Exception:
+        # Clean up temp file if the write or rename failed
+        try:
+            os.remove(temp_file.name)
+        except OSError as remove_err:
+            logging.error(f"Error removing temporary file {temp_file.name}: {remove_err}")
+        raise
+
+def _load_save_index(parsed_states=None):
+    """
+    Load the save index (game_id -> metadata dict).
+    If the index is missing or corrupt it is rebuilt from a full scan of the save directory;
+    the game states parsed by that scan are stored in parsed_states (if given).
+    """
+    try:
+        with open(SAVE_INDEX_PATH, 'rb') as f:
+            index = _load_json_bytes(f.read())
+        if _is_valid_save_index(index):
+            return index
+        logging.warning(f"Invalid save index format in {SAVE_INDEX_PATH}. Rebuilding.")
+    except FileNotFoundError:
+        logging.info("Save index not found. Building it from the save directory.")
+    except json.JSONDecodeError:
+        logging.warning(f"Could not decode save index {SAVE_INDEX_PATH}. Rebuilding.")
+    except Exception as e:
+        logging.error(f"Error reading save index {SAVE_INDEX_PATH}: {e}. Rebuilding.")
+
+    # Rebuilding is reconciling an empty index: every save file is parsed once
+    index = {}
+    _reconcile_save_index(index, parsed_states)
+    _write_save_index(index)
+    return index
+
+def _is_valid_save_index(index):
+    """True if index has the shape written by _write_save_index (anything else is rebuilt)"""
+    if not isinstance(index, dict):
+        return False
+    for entry in index.values():
+        if not isinstance(entry, dict) or not isinstance(entry.get('filename'), str):
+            return False
+        duplicates = entry.get('duplicates', [])
+        if not isinstance(duplicates, list) or not all(isinstance(name, str) for name in duplicates):
+            return False
+    return True
+
+def _write_save_index(index):
+    """Persist the save index. Failures are logged only, the index self-heals on the next load."""
+    try:
+        _write_file_atomic(SAVE_INDEX_PATH, _dump_json_bytes(index))
+        return True
+    except Exception as e:
+        logging.error(f"Error writing save index {SAVE_INDEX_PATH}: {e}")
+        return False
+
+def _update_save_index(game_id, entry=None):
+    """Set (or remove, if entry is None) the index entry for a game_id"""
+    index = _load_save_index()
+    if entry is None:
+        if index.pop(game_id, None) is None:
+            return
+    else:
+        previous = index.get(game_id)
+        if previous is not None:
+            # Other files of the same game stay known, so listings don't parse them again
+            duplicates = set(previous.get('duplicates', []))
+            duplicates.add(previous['filename'])
+            duplicates.discard(entry['filename'])
+            if duplicates:
+                entry = dict(entry, duplicates=sorted(duplicates))
+        index[game_id] = entry
+    _write_save_index(index)
+
+def _serialize_game_state(game_state):
+    """Build the save filename and the JSON bytes for a game state (snapshot taken synchronously)"""
+    game_id = game_state['game_id']
     # Create filename with case title if available
     case_title = game_state.get('case_title', 'Untitled Case')
     # Clean title to make it filename-friendly
-    safe_title = re.sub(r'[^\w\s-]', '', case_title).strip().replace(' ', '_')
+    safe_title = _TITLE_SANITIZE_RE.sub('', case_title).strip().replace(' ', '_')
     if not safe_title: # Handle cases where title becomes empty after cleaning
         safe_title = "Untitled_Case"
     # Limit filename length
@@ -172,81 +345,125 @@ def save_game_state(game_state):
          filename = filename[:max_len]
     filename += ".json"
 
+    # Underscore keys hold in-memory caches/indexes (e.g. the element sets), they are not saved
+    saved_state = {key: value for key, value in game_state.items() if not key.startswith('_')}
+    return filename, _dump_json_bytes(saved_state)
 
-    save_path = os.path.join(SAVE_DIR, filename)
+def _write_save_file(game_id, filename, data, index_entry):
+    """Write serialized game state to disk and update the save index (runs on the save writer thread). Returns True on success."""
+    save_path = _SAVE_DIR_PREFIX + filename
     try:
-        # Ensure the directory exists before writing
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-
+        # SAVE_DIR is created at startup, so no makedirs here
         # Atomically write the file
-        temp_path = save_path + ".tmp"
-        with open(temp_path, 'w') as f:
-            json.dump(game_state, f, indent=2)
-        os.replace(temp_path, save_path) # Atomic rename/replace
-
+        _write_file_atomic(save_path, data)
         logging.info(f"Game state saved successfully to {filename}")
-        return game_id
     except Exception as e:
         logging.error(f"Error saving game state to {save_path}: {e}", exc_info=True)
-        # Clean up temp file if rename failed
-        if os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except OSError as remove_err:
-                logging.error(f"Error removing temporary save file {temp_path}: {remove_err}")
+        return False
+
+    _update_save_index(game_id, index_entry)
+    return True
+
+def _wait_for_pending_saves():
+    """Block until all queued save writes have hit the disk"""
+    # The writer has a single worker, so a no-op job completes only after everything queued before it
+    _SAVE_EXECUTOR.submit(lambda: None).result()
+
+def save_game_state(game_state):
+    """
+    Save the game state to a JSON file.
+    The state is serialized immediately; the disk write happens on a background thread.
+    Returns the Future of the write (its result is True on success), or None if nothing was queued.
+    """
+    global _LAST_SAVE_FUTURE
+    game_id = game_state.get('game_id')
+    if not game_id:
+        logging.error("Attempted to save game state without a game_id.")
+        return None # Cannot save without an ID
+
+    # Update last_updated timestamp
+    game_state['last_updated'] = datetime.now().isoformat()
+
+    try:
+        filename, data = _serialize_game_state(game_state)
+    except Exception as e:
+        logging.error(f"Error serializing game state {game_id}: {e}", exc_info=True)
         return None
 
+    index_entry = {
+        'case_title': game_state.get('case_title') or 'Untitled Case',
+        'genre': game_state.get('genre', 'mystery'),
+        'last_updated': game_state['last_updated'],
+        'filename': filename
+    }
+    _LAST_SAVE_FUTURE = _SAVE_EXECUTOR.submit(_write_save_file, game_id, filename, data, index_entry)
+    return _LAST_SAVE_FUTURE
+
+def save_game_state_and_wait(game_state):
+    """Save the game state and block until the write finished. Returns True on success."""
+    future = save_game_state(game_state)
+    return future is not None and future.result()
+
+def _previous_save_failed(wait=False):
+    """True if the last queued save write has finished and failed (waits for it to finish if wait is set)"""
+    future = _LAST_SAVE_FUTURE
+    return future is not None and (wait or future.done()) and not future.result()
+
+def _quit_game(game_state):
+    """Report a failed earlier /save, then offer to save before leaving the game"""
+    global _LAST_SAVE_FUTURE
+    if _previous_save_failed(wait=True):
+        print("Warning: Your last /save could not be written. Please check the logs.")
+    save_q = read_input("Save progress before quitting? (yes/no): ").lower()
+    if save_q == 'yes':
+        if game_state and save_game_state_and_wait(game_state): print("Game saved.")
+        else: print("Error saving game.")
+    _LAST_SAVE_FUTURE = None # Reported here, so the next game doesn't warn about it again
+
 
 def find_game_file(game_id):
     """Find the filename associated with a game_id"""
-    # Check for exact UUID match first (legacy format)
-    exact_path = os.path.join(SAVE_DIR, f"{game_id}.json")
-    if os.path.exists(exact_path):
-        return exact_path
-
-    # Check for UUID_Title format
+    # Check for UUID_Title format and the exact UUID name (legacy format) in a single directory pass
+    titled_prefix = f"{game_id}_"
+    legacy_name = f"{game_id}.json"
     try:
-        for filename in os.listdir(SAVE_DIR):
-             # Ensure it's not a temp file and matches the pattern
-            if filename.startswith(f"{game_id}_") and filename.endswith('.json') and not filename.endswith('.tmp'):
-                return os.path.join(SAVE_DIR, filename)
+        with os.scandir(SAVE_DIR) as entries:
+            for entry in entries:
+                name = entry.name
+                # Ensure it's not a temp file and matches the pattern
+                if not name.endswith('.json') or name.endswith('.tmp'):
+                    continue
+                if name.startswith(titled_prefix) or name == legacy_name:
+                    return entry.path
     except FileNotFoundError:
          logging.warning(f"Save directory {SAVE_DIR} not found when searching for game {game_id}.")
          return None # Directory doesn't exist yet
-
-
-    # Fallback check just in case title was missing or file got renamed (less likely now)
-    # Ensure directory exists before listing
-    if os.path.exists(SAVE_DIR):
-         for filename in os.listdir(SAVE_DIR):
-             if filename.startswith(f"{game_id}") and filename.endswith('.json') and not filename.endswith('.tmp'):
-                 # Be cautious with this fallback, might match partial IDs if not careful
-                 # Ensure the part before .json matches the full game_id
-                 if filename.replace('.json', '') == game_id:
-                     return os.path.join(SAVE_DIR, filename)
     return None
 
-def load_game_state(game_id):
-    """Load a game state from a JSON file"""
-    file_path = find_game_file(game_id)
+def load_game_state(game_id, filename=None):
+    """Load a game state from a JSON file (filename, e.g. from the save index, skips the directory search)"""
+    _wait_for_pending_saves()
+    file_path = _SAVE_DIR_PREFIX + filename if filename else None
+    if not file_path or not os.path.exists(file_path):
+        file_path = find_game_file(game_id)
     if not file_path:
         logging.warning(f"Could not find save file for game_id: {game_id}")
+        _update_save_index(game_id, None) # Don't keep listing a save that no longer exists
         return None
 
     try:
-        with open(file_path, 'r') as f:
-            game_state = json.load(f)
-            logging.info(f"Loaded game state from {os.path.basename(file_path)}")
-            # Perform basic validation
-            if not isinstance(game_state, dict) or 'game_id' not in game_state:
-                 logging.error(f"Invalid game state format in {file_path}")
-                 return None
-            # Ensure game_id matches
-            if game_state.get('game_id') != game_id:
-                 logging.warning(f"Game ID mismatch in file {file_path}. Expected {game_id}, found {game_state.get('game_id')}. Loading anyway.")
-                 # Optionally, update the game_id in the loaded state here if desired
-                 # game_state['game_id'] = game_id
-            return game_state
+        game_state = _read_json_file(file_path)
+        logging.info(f"Loaded game state from {os.path.basename(file_path)}")
+        # Perform basic validation
+        if not isinstance(game_state, dict) or 'game_id' not in game_state:
+             logging.error(f"Invalid game state format in {file_path}")
+             return None
+        # Ensure game_id matches
+        if game_state.get('game_id') != game_id:
+             logging.warning(f"Game ID mismatch in file {file_path}. Expected {game_id}, found {game_state.get('game_id')}. Loading anyway.")
+             # Optionally, update the game_id in the loaded state here if desired
+             # game_state['game_id'] = game_id
+        return game_state
     except json.JSONDecodeError as e:
         logging.error(f"Error decoding JSON from {file_path}: {e}")
         return None
@@ -254,91 +471,159 @@ def load_game_state(game_id):
         logging.error(f"Error loading game state from {file_path}: {e}", exc_info=True)
         return None
 
-def get_all_saved_games():
-    """Get a list of all saved games with metadata"""
-    saved_games = []
-    if not os.path.exists(SAVE_DIR):
-        return []
-
-    for filename in os.listdir(SAVE_DIR):
-        if filename.endswith('.json') and not filename.endswith('.tmp'):
-            file_path = os.path.join(SAVE_DIR, filename)
-            try:
-                with open(file_path, 'r') as f:
-                    game_data = json.load(f)
+# Game states already parsed by the last get_all_saved_games call (only filled when the index
+# had to be rebuilt from the save files), so loading one of them doesn't read the file again
+_LAST_SCAN = {}
 
-                    # Robustly extract game ID
-                    file_game_id_part = filename.split('_')[0]
-                    data_game_id = game_data.get('game_id')
-                    # Basic validation of file_game_id_part format
-                    try:
-                        uuid.UUID(file_game_id_part)
-                        is_valid_uuid_prefix = True
-                    except ValueError:
-                        is_valid_uuid_prefix = False
-
-
-                    game_id = None
-                    if data_game_id:
-                        game_id = data_game_id
-                        # Verify filename prefix matches if possible
-                        if is_valid_uuid_prefix and not filename.startswith(data_game_id):
-                             logging.warning(f"Game ID in data ({data_game_id}) doesn't match filename prefix ({file_game_id_part}) for {filename}.")
-                    elif is_valid_uuid_prefix:
-                         # Fallback to filename prefix only if it looks like a UUID
-                        game_id = file_game_id_part
-
-
-                    if not game_id: # Skip if ID cannot be reliably determined
-                         logging.warning(f"Could not determine game_id for file: {filename}. Skipping.")
-                         continue
-
-                    case_title = game_data.get('case_title', 'Untitled Case')
-                    if not case_title: case_title = 'Untitled Case' # Ensure not None or empty
-
-                    saved_game = {
-                        'game_id': game_id,
-                        'case_title': case_title,
-                        'genre': game_data.get('genre', 'mystery'),
-                        'last_updated': game_data.get('last_updated'),
-                        'filename': filename # Keep for potential deletion use
-                    }
-                    saved_games.append(saved_game)
-            except json.JSONDecodeError:
-                logging.warning(f"Could not decode JSON from save file: {filename}. Skipping.")
-            except Exception as e:
-                logging.error(f"Error processing saved game file {filename}: {e}")
+def _list_save_files():
+    """Names of all save files in the save directory (names only, nothing is parsed)"""
+    try:
+        with os.scandir(SAVE_DIR) as entries:
+            return {
+                entry.name for entry in entries
+                if entry.name.endswith('.json') and entry.name != SAVE_INDEX_FILENAME and entry.is_file()
+            }
+    except FileNotFoundError:
+        return set()
+
+def _read_save_metadata(filename):
+    """
+    Read one save file. Returns (listing metadata, parsed game state), or (None, None) if it can't be used.
+    """
+    try:
+        with open(_SAVE_DIR_PREFIX + filename, 'rb') as f:
+            game_data = _load_json_bytes(f.read())
+
+        # Robustly extract game ID
+        file_game_id_part = filename.split('_')[0]
+        data_game_id = game_data.get('game_id')
+        # Basic validation of file_game_id_part format
+        is_valid_uuid_prefix = bool(_UUID_RE.match(file_game_id_part))
+
+
+        game_id = None
+        if data_game_id:
+            game_id = data_game_id
+            # Verify filename prefix matches if possible
+            if is_valid_uuid_prefix and not filename.startswith(data_game_id):
+                 logging.warning(f"Game ID in data ({data_game_id}) doesn't match filename prefix ({file_game_id_part}) for {filename}.")
+        elif is_valid_uuid_prefix:
+             # Fallback to filename prefix only if it looks like a UUID
+            game_id = file_game_id_part
+
+
+        if not game_id: # Skip if ID cannot be reliably determined
+             logging.warning(f"Could not determine game_id for file: {filename}. Skipping.")
+             return None, None
+
+        case_title = game_data.get('case_title', 'Untitled Case')
+        if not case_title: case_title = 'Untitled Case' # Ensure not None or empty
+
+        saved_game = {
+            'game_id': game_id,
+            'case_title': case_title,
+            'genre': game_data.get('genre', 'mystery'),
+            'last_updated': game_data.get('last_updated'),
+            'filename': filename # Keep for potential deletion use
+        }
+        return saved_game, game_data
+    except json.JSONDecodeError:
+        logging.warning(f"Could not decode JSON from save file: {filename}. Skipping.")
+    except Exception as e:
+        logging.error(f"Error processing saved game file {filename}: {e}")
+    return None, None
+
+def _reconcile_save_index(index, parsed_states=None):
+    """
+    Bring the index in line with the save directory (the source of truth) using a names-only scan:
+    files missing from the index (e.g. a crash before the index update, or copied in by hand)
+    are parsed and added, entries whose file is gone are dropped. When a game has several files
+    the newest save (by last_updated) is listed and the others are remembered as its 'duplicates'.
+    Parsed states of listed files are stored in parsed_states by game_id. Returns True if the index changed.
+    """
+    filenames = _list_save_files()
+    changed = False
+    for game_id, entry in list(index.items()):
+        if entry['filename'] not in filenames:
+            # Any other files of the game are unindexed now and get parsed below
+            logging.info(f"Save file for game {game_id} is gone. Removing it from the save index.")
+            del index[game_id]
+            changed = True
+            continue
+        duplicates = entry.get('duplicates')
+        if duplicates:
+            remaining = [name for name in duplicates if name in filenames]
+            if remaining != duplicates:
+                entry['duplicates'] = remaining
+                changed = True
+
+    indexed = set()
+    for entry in index.values():
+        indexed.add(entry['filename'])
+        indexed.update(entry.get('duplicates', ()))
+
+    for filename in sorted(filenames - indexed):
+        saved_game, game_data = _read_save_metadata(filename)
+        if saved_game is None:
+            continue
+        game_id = saved_game.pop('game_id')
+        current = index.get(game_id)
+        if current is not None:
+            if (saved_game['last_updated'] or '') <= (current.get('last_updated') or ''):
+                # An older second file of the game: remember it so it isn't parsed again
+                current.setdefault('duplicates', []).append(filename)
+                changed = True
+                continue
+            saved_game['duplicates'] = current.get('duplicates', []) + [current['filename']]
+            logging.info(f"Save file {filename} is newer than {current['filename']} for game {game_id}.")
+        else:
+            logging.info(f"Adding unindexed save file {filename} to the save index.")
+        index[game_id] = saved_game
+        changed = True
+        if parsed_states is not None:
+            # Only reuse states that pass load_game_state's validation (a game_id in the data itself)
+            if game_data.get('game_id'):
+                parsed_states[game_id] = game_data
+            else:
+                parsed_states.pop(game_id, None) # Don't keep the state of a file no longer listed
+    return changed
+
+def get_all_saved_games():
+    """Get a list of all saved games with metadata (read from the save index)"""
+    _wait_for_pending_saves()
+    # Only states parsed by this very call may be reused by select_game_to_load
+    _LAST_SCAN.clear()
+    index = _load_save_index(_LAST_SCAN)
+    if _reconcile_save_index(index, _LAST_SCAN):
+        _write_save_index(index)
+    saved_games = [dict(entry, game_id=game_id) for game_id, entry in index.items()]
 
     # Sort by last updated (newest first), handling potential None values
-    saved_games.sort(key=lambda x: x.get('last_updated', '1970-01-01T00:00:00'), reverse=True)
+    # ISO 8601 timestamps sort correctly as plain strings, no need to parse them
+    saved_games.sort(key=lambda x: x.get('last_updated') or '1970-01-01T00:00:00', reverse=True)
     return saved_games
 
 def delete_game_state(game_id):
     """Delete the save file(s) associated with a game_id"""
-    file_path = find_game_file(game_id) # find_game_file handles UUID_Title format
+    _wait_for_pending_saves() # A queued save must not recreate the file after deletion
     deleted = False
-    if file_path and os.path.exists(file_path):
-        try:
-            os.remove(file_path)
-            logging.info(f"Deleted saved game file: {os.path.basename(file_path)}")
-            deleted = True
-        except OSError as e:
-            logging.error(f"Error deleting game file {file_path}: {e}")
-            return False # Return immediately on error
-
-    # If find_game_file didn't find it initially, or to catch orphans (less likely now)
-    if not deleted and os.path.exists(SAVE_DIR):
-        files_in_dir = os.listdir(SAVE_DIR)
-        for filename in files_in_dir:
-             if filename.startswith(game_id) and filename.endswith('.json') and not filename.endswith('.tmp'):
-                 try:
-                    path_to_delete = os.path.join(SAVE_DIR, filename)
-                    os.remove(path_to_delete)
-                    logging.info(f"Deleted potential orphaned save file: {filename}")
-                    deleted = True # Mark as deleted if any file was removed
-                 except OSError as e:
-                    logging.error(f"Error deleting potential orphaned save file {filename}: {e}")
-                    # Continue trying other potential orphans even if one fails
+    # Single pass over the directory: catches the UUID_Title file, the legacy UUID file and any orphans
+    try:
+        with os.scandir(SAVE_DIR) as entries:
+            for entry in entries:
+                filename = entry.name
+                if filename.startswith(game_id) and filename.endswith('.json') and not filename.endswith('.tmp'):
+                    try:
+                        os.remove(entry.path)
+                        logging.info(f"Deleted saved game file: {filename}")
+                        deleted = True # Mark as deleted if any file was removed
+                    except OSError as e:
+                        logging.error(f"Error deleting game file {entry.path}: {e}")
+                        # Continue trying other matching files even if one fails
+    except FileNotFoundError:
+        logging.warning(f"Save directory {SAVE_DIR} not found when deleting game {game_id}.")
+
+    _update_save_index(game_id, None)
 
     if not deleted:
          logging.warning(f"Could not find or delete save file for game_id: {game_id}")
@@ -348,6 +633,36 @@ def delete_game_state(game_id):
 
 # --- Terminal UI Helpers ---
 
+# Standard terminal width often works well (adjust width as needed)
+_NARRATIVE_WRAPPER = textwrap.TextWrapper(width=80, break_long_words=True, drop_whitespace=True)
+# A word that may still be growing at the end of a streamed line
+_TRAILING_WORD_RE = re.compile(r'\S+\Z')
+# Leading 'YYYY-MM-DDTHH:MM' part of the ISO timestamps written by save_game_state
+_ISO_MINUTES_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}')
+
+# Waits for terminal input in select() (outside the GIL) before reading the line; None off a POSIX terminal
+if os.name != 'nt' and sys.stdin is not None and sys.stdin.isatty():
+    _STDIN_SELECTOR = selectors.DefaultSelector()
+    _STDIN_SELECTOR.register(sys.stdin, selectors.EVENT_READ)
+else:
+    _STDIN_SELECTOR = None
+
+def read_input(prompt=""):
+    """
+    Drop-in replacement for input(): shows the prompt immediately, then blocks until a line is ready.
+    Raises EOFError on end of input, like input().
+    """
+    if _STDIN_SELECTOR is None:
+        return input(prompt)
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    while not _STDIN_SELECTOR.select():
+        pass # Interrupted without an event, keep waiting
+    line = sys.stdin.readline()
+    if not line:
+        raise EOFError
+    return line.rstrip('\n')
+
 def clear_screen():
     """Clears the terminal screen."""
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -355,43 +670,60 @@ def clear_screen():
 def print_narrative(text):
     """Prints the LLM's narrative response, formatted for terminal."""
     print("\n--- Sherlock Holmes ---")
-    # Simple word wrapping (adjust width as needed)
-    width = 80 # Standard terminal width often works well
-    lines = text.split('\n')
-    wrapped_lines = []
-    for line in lines:
-        if not line.strip(): # Keep blank lines
-            wrapped_lines.append("")
-            continue
-
-        # Simple greedy wrapping
-        current_line = ""
-        for word in line.split():
-            if not current_line:
-                 current_line = word
-            elif len(current_line) + len(word) + 1 <= width:
-                current_line += " " + word
-            else:
-                # Check if word itself is longer than width
-                if len(word) > width:
-                    wrapped_lines.append(current_line) # Print previous line
-                    # Break long word (simple break, could be improved)
-                    wrapped_lines.append(word[:width])
-                    current_line = word[width:]
-                    # Continue breaking if still long
-                    while len(current_line) > width:
-                        wrapped_lines.append(current_line[:width])
-                        current_line = current_line[width:]
-
-                else:
-                     wrapped_lines.append(current_line)
-                     current_line = word
-        if current_line: # Add the last part of the line
-             wrapped_lines.append(current_line)
-
+    # Wrap each line to the terminal width, keeping blank lines as paragraph breaks
+    wrapped_lines = [
+        wrapped
+        for line in text.split('\n')
+        for wrapped in (_NARRATIVE_WRAPPER.wrap(line) if line.strip() else [""])
+    ]
     print("\n".join(wrapped_lines))
     print("---------------------\n")
 
+def _wrap_narrative_line(line):
+    """Wrap one line of narrative the way print_narrative does"""
+    return _NARRATIVE_WRAPPER.wrap(line) if line.strip() else [""]
+
+def stream_narrative(chunks, on_first_chunk=None):
+    """
+    Prints a streamed LLM response as it arrives, wrapped exactly like print_narrative.
+    on_first_chunk is called before anything is printed. Returns the full response text.
+    """
+    received = []
+    line = ""    # Current (unfinished) line of the response
+    emitted = 0  # Wrapped lines of it already printed
+    for chunk in chunks:
+        if not received:
+            if on_first_chunk: on_first_chunk()
+            print("\n--- Sherlock Holmes ---")
+        received.append(chunk)
+        *finished, line = (line + chunk).split('\n')
+        for done in finished:
+            # A line that just ended may also have been the one partly printed so far
+            for wrapped in _wrap_narrative_line(done)[emitted:]:
+                print(wrapped)
+            emitted = 0
+        # Greedy wrapping of the complete words so far fixes every wrapped line but the last
+        complete_words = _TRAILING_WORD_RE.sub('', line)
+        if complete_words:
+            wrapped_lines = _NARRATIVE_WRAPPER.wrap(complete_words)
+            for wrapped in wrapped_lines[emitted:-1]:
+                print(wrapped)
+            emitted = max(emitted, len(wrapped_lines) - 1)
+        sys.stdout.flush()
+    if received:
+        for wrapped in _wrap_narrative_line(line)[emitted:]:
+            print(wrapped)
+        print("---------------------\n")
+    return "".join(received)
+
+
+def format_timestamp(iso_timestamp):
+    """Format an ISO timestamp as 'YYYY-MM-DD HH:MM' for display, without parsing it"""
+    if not iso_timestamp:
+        return "Unknown date"
+    if _ISO_MINUTES_RE.match(iso_timestamp):
+        return f"{iso_timestamp[:10]} {iso_timestamp[11:16]}"
+    return iso_timestamp # Fallback to raw string
 
 def display_help():
     """Displays available commands during gameplay."""
@@ -408,6 +740,7 @@ def display_help():
 
 def start_new_game():
     """Starts a new game session."""
+    llm_handler = get_llm_handler()
     clear_screen()
     print("Starting a New Case...")
     print("---------------------")
@@ -420,12 +753,11 @@ def start_new_game():
 
     while True:
         try:
-            choice = input(f"Enter number (1-{len(genres)}): ")
+            choice = read_input(f"Enter number (1-{len(genres)}): ")
             genre_index = int(choice) - 1
             if 0 <= genre_index < len(genres):
                 selected_genre = genres[genre_index]
                 if selected_genre == 'random':
-                    import random
                     selected_genre = random.choice(genres[:-1]) # Exclude 'random' itself
                     print(f"Randomly selected genre: {selected_genre.capitalize()}")
                 break
@@ -444,45 +776,43 @@ def start_new_game():
     # system_prompt_for_genre = SHERLOCK_SYSTEM_PROMPT_TEMPLATE.replace("{GENRE}", selected_genre.upper())
 
     try:
-        # Generate the initial case description using the *specific* first-person prompt
-        initial_response = llm_handler.generate_new_case(selected_genre) # Model defaults here
+        # Generate the initial case description using the *specific* first-person prompt,
+        # printing it as it arrives (the title is only known once the full response is in)
+        # Model defaults here; the first chunk clears the "Generating..." message
+        initial_response = stream_narrative(llm_handler.generate_new_case_stream(selected_genre), clear_screen).strip()
         if not initial_response or "Blast! A most peculiar interference" in initial_response:
              # Handle LLM error during generation
              raise Exception("LLM failed to generate initial case description.")
 
         # Extract case title (robustly)
         case_title = extract_case_title(initial_response) or f"A {selected_genre.capitalize()} Case"
-
-        clear_screen() # Clear "Generating..." message
         print(f"Case Title: {case_title}")
         print("---------------------")
-        print_narrative(initial_response)
 
         # Initialize game state
+        now = datetime.now().isoformat()
         game_state = {
             'game_id': game_id,
             'genre': selected_genre,
             'model': llm_handler.default_model, # Store the model used
-            'started_at': datetime.now().isoformat(),
-            'last_updated': datetime.now().isoformat(),
+            'started_at': now,
+            'last_updated': now,
             'conversation': [], # Initialize conversation
              'case_elements': { # Initialize structure
                 'clues': [], 'suspects': [], 'locations': [], 'items': []
             },
             'case_title': case_title,
+            'initial_scene': summarize_initial_scene(initial_response), # Opening of every turn's context
             'case_solved': False
         }
 
         # Extract initial elements from the response *before* adding to conversation
-        initial_elements = extract_key_elements(initial_response)
-        for category in initial_elements:
-            game_state['case_elements'][category].extend(initial_elements[category])
-            # Deduplicate just in case
-            game_state['case_elements'][category] = list(dict.fromkeys(game_state['case_elements'][category]))
+        add_case_elements(game_state, extract_key_elements(initial_response))
 
 
         # Add initial messages to conversation history using the specific system prompt for this game
-        system_prompt_for_game = SHERLOCK_SYSTEM_PROMPT_TEMPLATE.replace("{GENRE}", selected_genre.upper())
+        # (the handler reuses conversation[0] verbatim as the prompt prefix on every turn)
+        system_prompt_for_game = llm_handler.render_system_prompt(selected_genre)
         game_state['conversation'].append({"role": "system", "content": system_prompt_for_game})
         # Simulate the initial generation interaction for context consistency
         game_state['conversation'].append({"role": "user", "content": f"Start a new {selected_genre} case for me (as Sherlock Holmes)."})
@@ -490,7 +820,7 @@ def start_new_game():
 
 
         # Initial save
-        if save_game_state(game_state):
+        if save_game_state_and_wait(game_state):
             print("(Game automatically saved)")
         else:
              print("Warning: Could not automatically save the new game.")
@@ -513,27 +843,18 @@ def select_game_to_load():
 
     if not saved_games:
         print("No saved games found.")
-        input("Press Enter to return to the main menu...")
+        read_input("Press Enter to return to the main menu...")
         return None
 
     print("Select a game to load:")
     for i, game in enumerate(saved_games):
-        last_updated_str = "Unknown date"
-        if game.get('last_updated'):
-            try:
-                 # Parse ISO format and make it more readable
-                 dt_obj = datetime.fromisoformat(game['last_updated'])
-                 last_updated_str = dt_obj.strftime("%Y-%m-%d %H:%M")
-            except ValueError:
-                last_updated_str = game['last_updated'] # Fallback to raw string
-
-
+        last_updated_str = format_timestamp(game.get('last_updated'))
         print(f"  {i+1}. {game.get('case_title', 'Untitled Case')} "
               f"({game.get('genre', 'mystery').capitalize()}) - Last Saved: {last_updated_str}")
 
     while True:
         try:
-            choice = input(f"Enter number (1-{len(saved_games)}) or 0 to cancel: ")
+            choice = read_input(f"Enter number (1-{len(saved_games)}) or 0 to cancel: ")
             choice_num = int(choice)
             if choice_num == 0: # Cancel
                 return None
@@ -541,12 +862,14 @@ def select_game_to_load():
             if 0 <= choice_index < len(saved_games):
                 selected_game_id = saved_games[choice_index]['game_id']
                 print(f"\nLoading '{saved_games[choice_index]['case_title']}'...")
-                loaded_state = load_game_state(selected_game_id)
+                # Reuse the state if the listing already parsed it, otherwise open the file directly
+                loaded_state = _LAST_SCAN.get(selected_game_id) or load_game_state(selected_game_id, saved_games[choice_index].get('filename'))
+                _LAST_SCAN.clear()
                 if loaded_state:
                      return loaded_state
                 else:
                      print(f"Error: Failed to load game {selected_game_id}. The save file might be corrupted.")
-                     input("Press Enter to return to the main menu...")
+                     read_input("Press Enter to return to the main menu...")
                      return None # Failed to load
             else:
                 print("Invalid choice.")
@@ -555,16 +878,66 @@ def select_game_to_load():
         except Exception as e:
              print(f"An unexpected error occurred loading the game: {e}")
              logging.error(f"Error in select_game_to_load choice handling: {e}", exc_info=True)
-             input("Press Enter to return to the main menu...")
+             read_input("Press Enter to return to the main menu...")
              return None
 
 
+# --- Gameplay Commands ---
+# Each command returns 'break' to leave the game loop or 'continue' to prompt again
+
+def cmd_quit(game_state):
+    """Offer to save, then leave the game (/quit)"""
+    _quit_game(game_state)
+    print("Returning to main menu...")
+    return 'break'
+
+def cmd_save(game_state):
+    """Queue a save of the current game (/save)"""
+    # The write runs in the background, so a failure surfaces on the next save
+    if _previous_save_failed():
+        print("Warning: The previous save could not be written. Please check the logs.")
+    if save_game_state(game_state):
+        print("Game progress saved.")
+    else:
+        print("Error: Could not save game.")
+    return 'continue'
+
+def cmd_help(game_state):
+    """Show the in-game commands (/help)"""
+    display_help()
+    return 'continue'
+
+def cmd_delete(game_state):
+    """Delete this game's save file after confirmation (/delete)"""
+    confirm = read_input(f"Are you sure you want to PERMANENTLY DELETE this saved game ('{game_state.get('case_title', '')}')? This cannot be undone. (yes/no): ").lower()
+    if confirm == 'yes':
+        game_id_to_delete = game_state.get('game_id')
+        if game_id_to_delete and delete_game_state(game_id_to_delete):
+            print("Save file deleted. Returning to main menu...")
+            return 'break' # State is invalid as the file is gone
+        print("Error: Could not delete save file.")
+    else:
+        print("Deletion cancelled.")
+    return 'continue'
+
+_COMMANDS = {
+    '/quit': cmd_quit,
+    '/save': cmd_save,
+    '/help': cmd_help,
+    '/delete': cmd_delete,
+}
+
+
 def play_game(game_state):
     """Main loop for playing an active game."""
     if not game_state or not isinstance(game_state, dict):
         print("Error: Cannot play game with invalid state.")
         logging.error("play_game called with invalid game_state.")
         return
+    llm_handler = get_llm_handler()
+
+    # The cache setting belongs to this session, so it lives under an underscore key, which is never saved
+    game_state['_llm_cache_enabled'] = LLM_CACHE_ENABLED
 
     clear_screen()
     print(f"Continuing Case: {game_state.get('case_title', 'Untitled Case')}")
@@ -588,61 +961,41 @@ def play_game(game_state):
 
     while True:
         try:
-            user_input = input("> ").strip()
+            user_input = read_input("> ").strip()
 
             if not user_input:
                 continue
 
             # --- Handle Commands ---
-            if user_input.lower() == '/quit':
-                save_q = input("Save progress before quitting? (yes/no): ").lower()
-                if save_q == 'yes':
-                    if save_game_state(game_state): print("Game saved.")
-                    else: print("Error saving game.")
-                print("Returning to main menu...")
-                break # Exit play_game loop
-
-            elif user_input.lower() == '/save':
-                if save_game_state(game_state):
-                    print("Game progress saved.")
-                else:
-                    print("Error: Could not save game.")
-                continue # Don't process /save as player input
-
-            elif user_input.lower() == '/help':
-                display_help()
-                continue
-
-            elif user_input.lower() == '/delete':
-                 confirm = input(f"Are you sure you want to PERMANENTLY DELETE this saved game ('{game_state.get('case_title', '')}')? This cannot be undone. (yes/no): ").lower()
-                 if confirm == 'yes':
-                     game_id_to_delete = game_state.get('game_id')
-                     if game_id_to_delete and delete_game_state(game_id_to_delete):
-                         print("Save file deleted. Returning to main menu...")
-                         game_state = None # Invalidate state as file is gone
-                         break # Exit play_game loop
-                     else:
-                         print("Error: Could not delete save file.")
-                 else:
-                     print("Deletion cancelled.")
-                 continue # Don't process /delete as player input
+            command = _COMMANDS.get(user_input.lower())
+            if command:
+                if command(game_state) == 'break':
+                    break # Exit play_game loop
+                continue # Don't process commands as player input
 
 
             # --- Process Player Input via LLM ---
             print("\nThinking...") # Provide feedback
             try:
                 # The handler now manages setting the correct system prompt internally
-                # based on game_state's genre within process_user_input
-                response, updated_game_state = llm_handler.process_user_input(user_input, game_state)
-
-                # Update game state reference for the current loop
-                game_state = updated_game_state
-
-                # Display response
-                clear_screen() # Clear previous output + "Thinking..."
-                print(f"Case: {game_state.get('case_title', 'Untitled Case')}")
-                print("---------------------")
-                print_narrative(response)
+                # based on game_state's genre within process_user_input_stream.
+                # The response is printed as it arrives instead of after the full generation.
+                def show_case_header():
+                    # Display response
+                    clear_screen() # Clear previous output + "Thinking..."
+                    print(f"Case: {game_state.get('case_title', 'Untitled Case')}")
+                    print("---------------------")
+                turn = llm_handler.process_user_input_stream(user_input, game_state)
+                response = stream_narrative(turn, show_case_header)
+
+                # Record the response, extract elements and update the game state reference
+                game_state = llm_handler.finalize(turn, response)
+
+                # Keep the history (and thus prompt size and save size) bounded. Summarizing is a
+                # full API call, so say why the prompt doesn't come back right away.
+                if llm_handler.needs_compaction(game_state):
+                    print("(Updating my case notes...)")
+                    llm_handler.compact_conversation(game_state)
 
                  # --- Auto-save (Optional) ---
                 # Uncomment below if you want game to save after every turn
@@ -657,10 +1010,10 @@ def play_game(game_state):
                  print("Please check the logs. You might need to restart.")
                  print("---------------------\n")
                  # Attempt to save the current state before potentially crashing
-                 if game_state and save_game_state(game_state):
+                 if game_state and save_game_state_and_wait(game_state):
                       print("(Attempted to save current state despite critical error)")
                  # Decide whether to continue or break after critical error
-                 input("Press Enter to attempt to return to the main menu...")
+                 read_input("Press Enter to attempt to return to the main menu...")
                  break # Exit game loop on critical LLM error
 
 
@@ -670,29 +1023,23 @@ def play_game(game_state):
                 print("Excellent work! The case is solved!")
                 print("***********************************\n")
                 # Ask user if they want to delete the solved game save
-                delete_q = input("Delete the save file for this solved case? (yes/no): ").lower()
+                delete_q = read_input("Delete the save file for this solved case? (yes/no): ").lower()
                 if delete_q == 'yes':
                      if game_state.get('game_id') and delete_game_state(game_state['game_id']):
                           print("Solved game save file deleted.")
                      else:
                           print("Could not delete save file.")
 
-                input("Press Enter to return to the main menu...")
+                read_input("Press Enter to return to the main menu...")
                 break # Exit play_game loop
 
         except EOFError: # Handle Ctrl+D
              print("\nQuitting game...")
-             save_q = input("Save progress before quitting? (yes/no): ").lower()
-             if save_q == 'yes':
-                  if game_state and save_game_state(game_state): print("Game saved.")
-                  else: print("Error saving game.")
+             _quit_game(game_state)
              break # Exit play_game loop
         except KeyboardInterrupt: # Handle Ctrl+C
              print("\nInterrupt received.")
-             save_q = input("Save progress before quitting? (yes/no): ").lower()
-             if save_q == 'yes':
-                  if game_state and save_game_state(game_state): print("Game saved.")
-                  else: print("Error saving game.")
+             _quit_game(game_state)
              break # Exit play_game loop
 
 
@@ -713,7 +1060,7 @@ def main():
         print("  3. Quit")
         print("-----------------------------------")
 
-        choice = input("Enter your choice (1-3): ")
+        choice = read_input("Enter your choice (1-3): ")
 
         if choice == '1':
             new_game_state = start_new_game()
@@ -731,11 +1078,16 @@ def main():
             break # Exit main loop
         else:
             print("Invalid choice. Please enter 1, 2, or 3.")
-            input("Press Enter to continue...")
+            read_input("Press Enter to continue...")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sherlock Holmes: Terminal Case")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Always query the LLM instead of reusing cached responses for identical requests")
+    args = parser.parse_args()
+    LLM_CACHE_ENABLED = not args.no_cache
+
     try:
-        # Optional: Add command line argument parsing here if needed later
         main()
     except Exception as e:
         # Log critical errors that escape the main loop
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+# orjson is optional, like for the save files; the stdlib json module is used otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Content-addressable on-disk cache for LLM responses: one JSON file per request hash
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, 'data', 'llm_cache')
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60 # 7 days
+
+
+def make_key(*fields):
+    """
+    Build a SHA-256 cache key from the request fields (model, prompt, sampling params, prompt version).
+    Each field is prefixed with its 8-byte length, so different field splits can never collide.
+    """
+    digest = hashlib.sha256()
+    for field in fields:
+        data = str(field).encode('utf-8')
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def get(key):
+    """Return the cached response text for a key, or None on a miss or an expired entry"""
+    path = _cache_path(key)
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        entry = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        if not isinstance(entry, dict) or not isinstance(entry.get('result_text'), str):
+            raise ValueError("not a cache entry")
+        expired = float(entry.get('expiresAt', 0)) < time.time()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable LLM cache entry {path}: {e}")
+        return None
+
+    if expired:
+        try:
+            os.remove(path)
+        except OSError:
+            pass # Expired entries are simply overwritten on the next put()
+        return None
+    return entry['result_text']
+
+
+def put(key, value, ttl_seconds=DEFAULT_TTL_SECONDS):
+    """Store response text for a key. Failures are logged only, the cache is best-effort."""
+    now = time.time()
+    entry = {'result_text': value, 'createdAt': now, 'expiresAt': now + ttl_seconds}
+    path = _cache_path(key)
+    temp_path = None
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        data = orjson.dumps(entry) if orjson is not None else json.dumps(entry).encode('utf-8')
+        # A unique temp name per write, so concurrent writers (the handler's worker threads) can't collide
+        with tempfile.NamedTemporaryFile('wb', dir=CACHE_DIR, prefix=key + '.', suffix='.tmp', delete=False) as f:
+            temp_path = f.name
+            f.write(data)
+        os.replace(temp_path, path) # Atomic rename/replace
+    except Exception as e:
+        logging.warning(f"Could not write LLM cache entry {path}: {e}")
+        if temp_path:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+def prune(max_age_seconds=DEFAULT_TTL_SECONDS):
+    """
+    Remove cache entries (and leftover temp files) last written more than max_age_seconds ago.
+    Most entries are never read again (narration prompts contain the whole history), so get()
+    alone would never expire them. Uses file mtimes only, nothing is parsed. Returns the number removed.
+    """
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    try:
+        with os.scandir(CACHE_DIR) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    pass # Removed concurrently or not accessible, try again next time
+    except FileNotFoundError:
+        return 0
+    if removed:
+        logging.info(f"Pruned {removed} expired LLM cache entr{'y' if removed == 1 else 'ies'}.")
+    return removed
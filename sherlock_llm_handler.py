@@ -1,21 +1,125 @@
+import hashlib
+import importlib.util
+import itertools
 import logging
 import os
 import re
 import json
-from datetime import datetime
-from openai import OpenAI
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import sherlock_llm_cache
+
+# Narration sampling settings (also part of the response cache key)
+NARRATION_MAX_TOKENS = 800 # Increased slightly for potentially richer narrative
+NARRATION_TEMPERATURE = 0.75 # Slightly higher temp for more creativity
+# Bump whenever the prompts change in a way that should invalidate cached responses
+PROMPT_VERSION = "2"
+
+# Connection pool shared by all API calls of a handler (seconds / connection counts). Idle connections
+# are kept well past the httpx default of 5s, so they survive the player's think-time between turns.
+API_TIMEOUT, API_CONNECT_TIMEOUT = 60.0, 10.0
+API_MAX_KEEPALIVE_CONNECTIONS, API_MAX_CONNECTIONS, API_KEEPALIVE_EXPIRY = 4, 8, 120.0
+
+# Number of recent user/assistant turns kept verbatim in the conversation
+MAX_RECENT_TURNS = 16
+# Older turns are summarized in batches of this size, so summarization doesn't run on every turn
+SUMMARY_BATCH_TURNS = 8
+
+# In-character reply used when the LLM call fails
+API_ERROR_RESPONSE = """Blast! A most peculiar interference clouds my thoughts. Perhaps the fog is thicker than I imagined, or maybe it's simply a failure of my own deductive faculties at this moment. I should refocus. What was the immediate matter at hand?
+
+TIME UPDATE: A moment passes as I collect my thoughts."""
+
+# Case title labels, most specific first ("Case Title:" is the same pattern under IGNORECASE)
+_TITLE_PATTERNS = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'CASE TITLE:\s*(.*?)(?:\n|$)',
+    r'Title:\s*(.*?)(?:\n|$)',
+))
+
+# Labeled element lines ("NEW CLUE: ...") in LLM responses, matched in a single pass.
+# ASCII-only case folding, so group(1).lower() is always a key of _ELEMENT_CATEGORIES ('NEW İTEM:' is skipped).
+_ELEMENT_LABEL_RE = re.compile(r'^[ \t]*NEW (CLUE|SUSPECT|LOCATION|ITEM):(.*)$', re.IGNORECASE | re.MULTILINE | re.ASCII)
+_ELEMENT_CATEGORIES = {'clue': 'clues', 'suspect': 'suspects', 'location': 'locations', 'item': 'items'}
+# Template placeholders the model sometimes echoes back instead of a real element
+_ELEMENT_PLACEHOLDERS = {
+    'clues': '[description]', 'suspects': '[name/description]', 'locations': '[name]', 'items': '[description]'
+}
+# Read-only stand-in for a game without case elements yet (empty tuples, nothing allocated per turn)
+_EMPTY_ELEMENTS = {'clues': (), 'suspects': (), 'locations': (), 'items': ()}
+
+# Common action/question words that make an input relevant without asking the LLM
+_COMMAND_WORDS = (
+    'look', 'examine', 'check', 'talk', 'speak', 'go', 'move', 'walk', 'take', 'pick', 'use', 'investigate',
+    'search', 'find', 'ask', 'tell', 'observe', 'deduce', 'what', 'where', 'who', 'why', 'how'
+)
+# Every this many command hits, a game's pattern is rebuilt with its most used words first
+_COMMAND_REORDER_INTERVAL = 20
+
+def _compile_command_re(words):
+    # ASCII-only case folding: Unicode IGNORECASE would also match e.g. 'ſearch', whose lower() is no command word
+    return re.compile(r'\b(' + '|'.join(words) + r')\b', re.IGNORECASE | re.ASCII)
+
+_COMMAND_WORD_RE = _compile_command_re(_COMMAND_WORDS)
+
+# Constant part of the per-turn context prompt, joined once at import. It opens every context
+# (right after the game's system prompt), so it is part of the prompt prefix shared by all turns.
+_STATIC_CONTEXT = "\n".join((
+    "# ROLE: You ARE Sherlock Holmes, continuing your investigation.",
+    "# TASK: Narrate your next actions/thoughts/dialogue based on the player's input, maintaining YOUR first-person perspective.",
+    "# CRITICAL: Use ONLY 'I', 'me', 'my', 'myself'. NEVER use 'Holmes', 'he', 'him'.",
+    "## Instructions:",
+    "1. Create a detailed response AS Sherlock Holmes (using 'I').",
+    "2. Please respond with a narrative that is at least 5-6 sentences long.",
+    "3. Make each sentence rich and meaningful from YOUR perspective.",
+    "4. Advance the mystery with appropriate new clues and developments based on YOUR deductions.",
+    "5. Respond directly to the player's input (which represents YOUR actions/speech).",
+    "6. Use YOUR distinctive voice and deductive style.",
+    "7. Then include any new discoveries with proper labels:",
+    "   - NEW CLUE: (only if YOU make a new discovery)",
+    "   - NEW LOCATION: (only if YOU discover a new location)",
+    "   - NEW SUSPECT: (only if YOU identify a new suspect)",
+    "   - NEW ITEM: (only if YOU find a relevant item)",
+    "   - TIME UPDATE: (always include YOUR sense of time passing)",
+    "8. Maintain continuity with previous elements from YOUR perspective.",
+))
+# Locations and items in the context: the newest few, plus older ones mentioned in the last few turns
+_RECENT_ELEMENTS = 3
+_REFERENCE_TURNS = 3
+# An element counts as mentioned when at least half of its significant words (4+ letters,
+# not in this list) appear in those turns; descriptions rarely reappear word for word
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_REFERENCE_STOPWORDS = frozenset((
+    'about', 'after', 'been', 'from', 'have', 'into', 'near', 'some', 'that', 'their', 'there',
+    'these', 'this', 'those', 'very', 'were', 'what', 'when', 'which', 'with'
+))
+
+def _compile_phrase_re(phrases):
+    """One case-insensitive alternation matching any of the phrases as a substring"""
+    # ASCII-only case folding, like the old lower()-and-compare on these ASCII phrases
+    return re.compile('|'.join(map(re.escape, phrases)), re.IGNORECASE | re.ASCII)
+
+# Phrases indicating the player is attempting to solve the case
+_SOLVE_RE = _compile_phrase_re((
+    "i believe the culprit is", "the killer must be", "my conclusion is",
+    "i accuse", "the solution involves", "it was", "so the murderer is",
+    "the answer is", "i've solved it"
+))
+# Confirmation phrases from the LLM (as Holmes)
+_CONFIRM_RE = _compile_phrase_re((
+    "indeed, that is correct", "precisely my deduction", "you have unravelled it",
+    "an astute conclusion", "the case is closed", "brilliant deduction",
+    "you've pieced it together", "elementary, once reasoned out", "correct",
+    "exactly so", "congratulations are in order"
+))
+_DENY_RE = _compile_phrase_re(("incorrect", "not quite", "alas, no", "mistaken", "i think not"))
 
 # --- Helper Functions (Unchanged) ---
 def extract_case_title(response):
     """Extract the case title from the LLM response"""
     # Try a few patterns for robustness
-    patterns = [
-        r'CASE TITLE:\s*(.*?)(?:\n|$)',
-        r'Case Title:\s*(.*?)(?:\n|$)',
-        r'Title:\s*(.*?)(?:\n|$)',
-    ]
-    for pattern in patterns:
-        title_match = re.search(pattern, response, re.IGNORECASE)
+    for pattern in _TITLE_PATTERNS:
+        title_match = pattern.search(response)
         if title_match:
             title = title_match.group(1).strip().strip('"') # Remove potential quotes
             # Avoid picking up instructions as titles
@@ -32,46 +136,179 @@ def extract_key_elements(response):
         'locations': [],
         'items': []
     }
-    # Make extraction case-insensitive and more robust
-    lines = response.split('\n')
-    for line in lines:
-        line_lower = line.strip().lower()
-        if line_lower.startswith("new clue:"):
-            element = line[len("new clue:"):].strip()
-            if element and element != "[description]" and len(element) > 2: # Avoid empty/placeholder
-                elements['clues'].append(element)
-        elif line_lower.startswith("new suspect:"):
-            element = line[len("new suspect:"):].strip()
-            if element and element != "[name/description]" and len(element) > 2:
-                elements['suspects'].append(element)
-        elif line_lower.startswith("new location:"):
-            element = line[len("new location:"):].strip()
-            if element and element != "[name]" and len(element) > 2:
-                elements['locations'].append(element)
-        elif line_lower.startswith("new item:"):
-            element = line[len("new item:"):].strip()
-            if element and element != "[description]" and len(element) > 2:
-                elements['items'].append(element)
-
-    # Deduplicate lists
-    for category in elements:
-        elements[category] = list(dict.fromkeys(elements[category]))
-
+    # Make extraction case-insensitive and more robust: one regex pass over the whole response
+    for match in _ELEMENT_LABEL_RE.finditer(response):
+        category = _ELEMENT_CATEGORIES[match.group(1).lower()]
+        element = match.group(2).strip()
+        # Avoid empty/placeholder
+        if element and element != _ELEMENT_PLACEHOLDERS[category] and len(element) > 2:
+            elements[category].append(element)
+
+    # Not deduplicated here: add_case_elements skips anything already known
     return elements
 
+
+def _ensure_element_index(game_state):
+    """
+    Return the per-category sets of known elements, building them from game_state['case_elements']
+    on first use. The sets live under the underscore key '_element_sets', which is never saved.
+    """
+    element_sets = game_state.get('_element_sets')
+    if element_sets is None:
+        case_elements = game_state.get('case_elements', {})
+        element_sets = game_state['_element_sets'] = {
+            category: set(elements) for category, elements in case_elements.items()
+        }
+    return element_sets
+
+
+def _record_command_hit(game_state, word):
+    """
+    Count a matched command word and periodically reorder this game's command pattern by frequency.
+    Counts and pattern live under the underscore keys '_cmd_hits' and '_cmd_re', which are never saved.
+    """
+    hits = game_state.get('_cmd_hits')
+    if hits is None:
+        hits = game_state['_cmd_hits'] = dict.fromkeys(_COMMAND_WORDS, 0)
+    hits[word] += 1
+    total = game_state['_cmd_hit_total'] = game_state.get('_cmd_hit_total', 0) + 1
+    if total % _COMMAND_REORDER_INTERVAL == 0:
+        # sorted() is stable, so words with equal counts keep their original order
+        game_state['_cmd_re'] = _compile_command_re(sorted(_COMMAND_WORDS, key=hits.__getitem__, reverse=True))
+
+
+def _relevance_key(user_input):
+    """Short hash of the normalized input, used as key of game_state['relevance_cache']"""
+    return hashlib.sha256(user_input.lower().strip().encode('utf-8')).hexdigest()[:16]
+
+
+def _significant_words(text):
+    """Lowercased words of text that can identify an element (see _REFERENCE_STOPWORDS)"""
+    return {word for word in _WORD_RE.findall(text.lower()) if len(word) >= 4 and word not in _REFERENCE_STOPWORDS}
+
+
+def _referenced_elements(elements, recent_words):
+    """The newest _RECENT_ELEMENTS elements plus older ones mentioned in the recent turns, in order"""
+    cutoff = len(elements) - _RECENT_ELEMENTS
+    if cutoff <= 0:
+        return elements
+    referenced = []
+    for element in elements[:cutoff]:
+        words = _significant_words(element)
+        if words and 2 * len(words & recent_words) >= len(words):
+            referenced.append(element)
+    return referenced + list(elements[cutoff:])
+
+
+def summarize_initial_scene(response):
+    """First paragraph of the opening narrative, truncated for the per-turn context"""
+    initial_scene = response.partition("\n\n")[0]
+    # Truncate if very long
+    if len(initial_scene) > 300:
+        initial_scene = initial_scene[:300] + "..."
+    return initial_scene
+
+
+def _first_dialog_index(game_state):
+    """
+    Index of the first non-system message of the conversation (only the leading messages are system
+    messages). Cached under the underscore key '_first_dialog_idx', which is never saved.
+    """
+    first = game_state.get('_first_dialog_idx')
+    if first is None:
+        conversation = game_state.get('conversation', [])
+        first = 0
+        while first < len(conversation) and conversation[first].get("role") == "system":
+            first += 1
+        game_state['_first_dialog_idx'] = first
+    return first
+
+
+def add_case_elements(game_state, new_elements):
+    """
+    Append new, not yet known elements to game_state['case_elements'] (order preserved),
+    using the set index for O(1) membership checks. Returns the number added per category.
+    """
+    case_elements = game_state.setdefault('case_elements', {'clues': [], 'suspects': [], 'locations': [], 'items': []})
+    element_sets = _ensure_element_index(game_state)
+    added_counts = {}
+    for category, elements in new_elements.items():
+        current = case_elements.setdefault(category, [])
+        known = element_sets.get(category)
+        if known is None:
+            known = element_sets[category] = set(current)
+        added_count = 0
+        for element in elements:
+            if element not in known:
+                known.add(element)
+                current.append(element)
+                added_count += 1
+        added_counts[category] = added_count
+    return added_counts
+
 # --- LLM Handler Class ---
+class StreamedTurn:
+    """
+    One turn started with SherlockLLMHandler.process_user_input_stream. Iterating it yields the
+    response text in chunks; is_relevant is set once the first chunk is out (None before that).
+    """
+    def __init__(self, user_input, game_state):
+        self.user_input = user_input
+        self.game_state = game_state
+        self.is_relevant = None
+        self._chunks = iter(())
+
+    def __iter__(self):
+        return self._chunks
+
+
 class SherlockLLMHandler:
-    def __init__(self, system_prompt_template, default_model="mistralai/Mixtral-8x7B-Instruct-v0.1"):
+    def __init__(self, system_prompt_template, default_model="mistralai/Mixtral-8x7B-Instruct-v0.1", api_key=None):
         # Store the template, the actual prompt used will include the genre
         self.system_prompt_template = system_prompt_template
         self.default_model = default_model
 
-        # Initialize OpenAI client (ensure API key is loaded via dotenv or environment)
+        # Imported here rather than at module level: the openai/httpx import chain is slow
+        # and only needed once a handler exists
+        import httpx
+        from openai import OpenAI, DefaultHttpxClient
+
+        # Initialize OpenAI client (API key passed in, or loaded via dotenv or environment).
+        # One pooled HTTP client is reused by the relevance check, narration and summary calls.
+        # HTTP/2 needs the optional h2 package, HTTP/1.1 keep-alive is used otherwise.
+        self._http = DefaultHttpxClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            timeout=httpx.Timeout(API_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_keepalive_connections=API_MAX_KEEPALIVE_CONNECTIONS,
+                                max_connections=API_MAX_CONNECTIONS, keepalive_expiry=API_KEEPALIVE_EXPIRY)
+        )
         self.client = OpenAI(
             base_url="https://api.studio.nebius.com/v1/",
-            api_key=os.environ.get("NEBIUS_API_KEY")
+            api_key=api_key or os.environ.get("NEBIUS_API_KEY"),
+            http_client=self._http
         )
         # The specific system prompt (with genre) is set per interaction
+        # Runs the relevance API check and the narration call of a turn side by side
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='llm-call')
+        # Expired response cache entries are removed once per session, off the game thread
+        self._executor.submit(sherlock_llm_cache.prune)
+        # Rendered system prompts by genre (the template is fixed for the handler's lifetime)
+        self._system_prompts = {}
+
+
+    def render_system_prompt(self, genre):
+        """Return the system prompt for a genre, rendered from the template once per genre"""
+        system_prompt = self._system_prompts.get(genre)
+        if system_prompt is None:
+            genre_upper = genre.upper()
+            # Ensure the template exists before replacing
+            if self.system_prompt_template:
+                 system_prompt = self.system_prompt_template.replace("{GENRE}", genre_upper)
+            else:
+                 logging.error("System prompt template is missing!")
+                 system_prompt = f"# Sherlock Holmes Adventure ({genre_upper})\nYou ARE Sherlock Holmes. Respond in first person." # Basic fallback
+            self._system_prompts[genre] = system_prompt
+        return system_prompt
 
 
     def check_input_relevance(self, user_input, game_state):
@@ -79,39 +316,56 @@ class SherlockLLMHandler:
         Check if the user input appears relevant to the current case using a lightweight API call.
         (This function remains largely the same, focusing on context, not perspective)
         """
+        is_relevant = self._quick_relevance(user_input, game_state)
+        if is_relevant is None:
+            verdict = self._api_relevance(user_input, self._relevance_prompt(user_input, game_state))
+            is_relevant = self._store_relevance(user_input, game_state, verdict)
+        return is_relevant
+
+
+    def _quick_relevance(self, user_input, game_state):
+        """Relevance verdict without an API call (length, command words, cached verdicts), None if undecided"""
         if len(user_input.strip()) < 3:
             logging.info(f"Input relevance check: '{user_input}' - Too short, returning False")
             return False
 
-        common_commands = ['look', 'examine', 'check', 'talk', 'speak', 'go', 'move', 'walk',
-                        'take', 'pick', 'use', 'investigate', 'search', 'find', 'ask', 'tell',
-                        'observe', 'deduce', 'what', 'where', 'who', 'why', 'how']
-        user_input_lower = user_input.lower()
-        if any(command in user_input_lower.split() for command in common_commands):
+        command_match = game_state.get('_cmd_re', _COMMAND_WORD_RE).search(user_input)
+        if command_match:
+            _record_command_hit(game_state, command_match.group(1).lower())
             logging.info(f"Input relevance check: '{user_input}' - Contains common command, returning True")
             return True
 
-        try:
-            case_title = game_state.get('case_title', 'Unknown Mystery')
-            elements_summary = []
-            if 'case_elements' in game_state:
-                elements = game_state['case_elements']
-                if elements.get('suspects'):
-                    elements_summary.append("Suspects: " + ", ".join(elements['suspects'][-3:]))
-                if elements.get('locations'):
-                    elements_summary.append("Locations: " + ", ".join(elements['locations'][-3:]))
-                if elements.get('clues'):
-                    elements_summary.append("Clues: " + ", ".join(elements['clues'][-3:]))
-
-            last_exchange = ""
-            if game_state.get('conversation'):
-                for msg in reversed(game_state['conversation']):
-                    if msg.get('role') == 'assistant':
-                        content = msg.get('content', '')
-                        last_exchange = content.split('\n\n')[0] if '\n\n' in content else content
-                        break
-
-            prompt = f"""
+        # Verdicts from earlier API checks in this game, keyed by a short hash of the normalized input
+        cached = game_state.get('relevance_cache', {}).get(_relevance_key(user_input))
+        if cached is not None:
+            logging.info(f"Input relevance check: '{user_input}' - Cached verdict: {cached}")
+        return cached
+
+
+    def _relevance_prompt(self, user_input, game_state):
+        """Build the prompt for the relevance API check"""
+        case_title = game_state.get('case_title', 'Unknown Mystery')
+        elements_summary = []
+        elements = game_state.get('case_elements') or _EMPTY_ELEMENTS
+        suspects = elements.get('suspects')
+        if suspects:
+            elements_summary.append("Suspects: " + ", ".join(suspects[-3:]))
+        locations = elements.get('locations')
+        if locations:
+            elements_summary.append("Locations: " + ", ".join(locations[-3:]))
+        clues = elements.get('clues')
+        if clues:
+            elements_summary.append("Clues: " + ", ".join(clues[-3:]))
+
+        last_exchange = ""
+        if game_state.get('conversation'):
+            for msg in reversed(game_state['conversation']):
+                if msg.get('role') == 'assistant':
+                    content = msg.get('content', '')
+                    last_exchange = content.partition('\n\n')[0]
+                    break
+
+        return f"""
     Analyze user input for a Sherlock Holmes game. Is the input relevant to the case or reasonable roleplaying?
 
     Case: {case_title}
@@ -123,6 +377,13 @@ class SherlockLLMHandler:
     Is this input relevant to the Sherlock Holmes case or reasonable roleplaying as Holmes? Answer only YES or NO.
     """
 
+
+    def _api_relevance(self, user_input, prompt):
+        """
+        Ask the small model whether the input is relevant. Returns None if the call failed.
+        Does not touch game_state, so it can run on a worker thread.
+        """
+        try:
             response = self.client.chat.completions.create(
                 model="microsoft/phi-4", # Use a consistent, potentially faster model for this check
                 max_tokens=10,
@@ -146,65 +407,114 @@ class SherlockLLMHandler:
 
         except Exception as e:
             logging.error(f"Error in relevance check API call: {e}", exc_info=True)
+            return None
+
+
+    def _store_relevance(self, user_input, game_state, verdict):
+        """Cache an API verdict for this game and return it (failed checks default to relevant, uncached)"""
+        if verdict is None:
             logging.info(f"Input relevance check: '{user_input}' - API call failed, defaulting to True")
             return True # Default to relevant on error
+        game_state.setdefault('relevance_cache', {})[_relevance_key(user_input)] = verdict
+        return verdict
 
 
-    def serialize_conversation_history(self, game_state, max_entries=5):
-        """Convert recent conversation history to a serialized string format for context"""
-        history = []
-        conversation = game_state.get('conversation', [])
-        # Skip system message, get last N user/assistant pairs
-        recent_exchanges = [msg for msg in conversation if msg.get("role") in ["user", "assistant"]]
-        recent_exchanges = recent_exchanges[-(max_entries * 2):]
+    def _format_history_entry(self, msg):
+        """Format one conversation message for the history context (None for non-dialogue messages)"""
+        role = msg.get("role")
+        content = msg.get("content", "")
+        if role == "user":
+            # Represent user input as Holmes' action/thought for context
+            return f"My Action/Thought: {content}"
+        elif role == "assistant":
+            # Truncate very long narrative responses for context
+            if len(content) > 500:
+                 content = content[:500] + "..."
+            return f"Narrative/Outcome:\n{content}" # Using a clearer label
+        return None
 
-        for msg in recent_exchanges:
-            role = msg.get("role")
-            content = msg.get("content", "")
-            if role == "user":
-                # Represent user input as Holmes' action/thought for context
-                history.append(f"My Action/Thought: {content}")
-            elif role == "assistant":
-                # Truncate very long narrative responses for context
-                if len(content) > 500:
-                     content = content[:500] + "..."
-                history.append(f"Narrative/Outcome:\n{content}") # Using a clearer label
 
-        return "\n\n".join(history)
+    def serialize_conversation_history(self, game_state, max_entries=5):
+        """
+        Convert recent conversation history to a serialized string format for context.
+        The formatted entries are cached in game_state['_hist_cache'] and only new messages are
+        formatted on later calls, as long as the conversation was only appended to.
+        """
+        conversation = game_state.get('conversation', [])
+        cache = game_state.get('_hist_cache')
+        cached_len = cache['len'] if cache else 0
+        is_append_only = (
+            cache is not None
+            and cache['max_entries'] == max_entries
+            and cached_len <= len(conversation)
+            and (cached_len == 0 or conversation[cached_len - 1] is cache['last'])
+        )
+        if is_append_only:
+            if cached_len == len(conversation):
+                return cache['text']
+            history = cache['entries']
+            start = cached_len
+        else:
+            # Skip system message, keep last N user/assistant pairs. Everything after the leading
+            # system message(s) is dialogue, so only the last 2N messages need to be formatted.
+            history = deque(maxlen=max_entries * 2)
+            start = max(_first_dialog_index(game_state), len(conversation) - max_entries * 2)
+        new_messages = itertools.islice(conversation, start, None)
+
+        for msg in new_messages:
+            entry = self._format_history_entry(msg)
+            if entry is not None:
+                history.append(entry)
+
+        text = "\n\n".join(history)
+        game_state['_hist_cache'] = {
+            'len': len(conversation),
+            'last': conversation[-1] if conversation else None,
+            'max_entries': max_entries,
+            'entries': history,
+            'text': text,
+        }
+        return text
 
 
     def create_rich_context(self, game_state, user_input):
         """Create a rich, detailed context for the LLM that preserves the story quality"""
-        case_title = game_state.get('case_title', 'Unknown Mystery')
-        genre = game_state.get('genre', 'mystery').upper() # Genre used in system prompt too
-
+        # (The genre only appears in the system prompt, which is rendered once per game)
         # Get case elements
-        clues = game_state.get('case_elements', {}).get('clues', [])
-        suspects = game_state.get('case_elements', {}).get('suspects', [])
-        locations = game_state.get('case_elements', {}).get('locations', [])
-        items = game_state.get('case_elements', {}).get('items', [])
-
-        # Get initial scene description from first assistant message (if exists)
-        initial_scene = "The case began mysteriously..." # Fallback
-        for msg in game_state.get('conversation', []):
-            if msg.get("role") == "assistant":
-                content = msg.get("content", "")
-                initial_scene = content.split("\n\n")[0] if "\n\n" in content else content
-                # Truncate if very long
-                if len(initial_scene) > 300:
-                    initial_scene = initial_scene[:300] + "..."
-                break
+        elements = game_state.get('case_elements') or _EMPTY_ELEMENTS
+        clues = elements.get('clues', ())
+        suspects = elements.get('suspects', ())
+        locations = elements.get('locations', ())
+        items = elements.get('items', ())
+
+        # Initial scene description, stored when the case was generated
+        initial_scene = game_state.get('initial_scene')
+        if initial_scene is None:
+            # Older saves: take it from the first assistant message (if exists) and store it
+            initial_scene = "The case began mysteriously..." # Fallback
+            for msg in game_state.get('conversation', []):
+                if msg.get("role") == "assistant":
+                    initial_scene = game_state['initial_scene'] = summarize_initial_scene(msg.get("content", ""))
+                    break
+
+        # Summary of older turns that were compacted out of the conversation (if any)
+        earlier_summary = game_state.get('case_so_far', "")
 
         conversation_history = self.serialize_conversation_history(game_state)
 
+        # Older locations/items only matter again once the story comes back to them
+        recent_words = _significant_words("\n".join(
+            msg.get("content", "") for msg in game_state.get('conversation', [])[-2 * _REFERENCE_TURNS:]
+        ))
+        locations = _referenced_elements(locations, recent_words)
+        items = _referenced_elements(items, recent_words)
+
         # Build the prompt parts
         context_parts = [
-            f"# ROLE: You ARE Sherlock Holmes, continuing your investigation.",
-            f"# TASK: Narrate your next actions/thoughts/dialogue based on the player's input, maintaining YOUR first-person perspective.",
-            f"# CRITICAL: Use ONLY 'I', 'me', 'my', 'myself'. NEVER use 'Holmes', 'he', 'him'.",
-            f"## Initial Scene Summary:",
+            _STATIC_CONTEXT,
+            "## Initial Scene Summary:",
             initial_scene,
-            f"## Known Facts (My Discoveries):",
+            "## Known Facts (My Discoveries):",
         ]
 
         if clues: context_parts.append("### Clues I've Found:\n- " + "\n- ".join(clues[-5:])) # Last 5
@@ -212,48 +522,28 @@ class SherlockLLMHandler:
         if locations: context_parts.append("### Locations I'm Aware Of:\n- " + "\n- ".join(locations))
         if items: context_parts.append("### Items I've Noted:\n- " + "\n- ".join(items))
 
+        if earlier_summary:
+            context_parts.append("## Earlier Events (Summary):")
+            context_parts.append(earlier_summary)
+
         if conversation_history:
             context_parts.append("## Recent Events (Summary):")
             context_parts.append(conversation_history)
 
-        # --- EDITED Instructions Section ---
-        context_parts.append("## Instructions:")
-        context_parts.append(f"CRITICAL REMINDER: You ARE Sherlock Holmes. Write the entire response in the FIRST PERSON, using 'I' and 'my'. Describe your actions, thoughts, and dialogue. Do NOT refer to Holmes in the third person.")
-        context_parts.append("1. Create a detailed response AS Sherlock Holmes (using 'I').")
-        context_parts.append("2. Please respond with a narrative that is at least 5-6 sentences long.")
-        context_parts.append("3. Make each sentence rich and meaningful from YOUR perspective.")
-        context_parts.append("4. Advance the mystery with appropriate new clues and developments based on YOUR deductions.")
-        context_parts.append("5. Respond directly to the player's input (which represents YOUR actions/speech).")
-        context_parts.append("6. Use YOUR distinctive voice and deductive style.")
-        context_parts.append("7. Then include any new discoveries with proper labels:")
-        context_parts.append("   - NEW CLUE: (only if YOU make a new discovery)")
-        context_parts.append("   - NEW LOCATION: (only if YOU discover a new location)")
-        context_parts.append("   - NEW SUSPECT: (only if YOU identify a new suspect)")
-        context_parts.append("   - NEW ITEM: (only if YOU find a relevant item)")
-        context_parts.append("   - TIME UPDATE: (always include YOUR sense of time passing)")
-        context_parts.append("8. Maintain continuity with previous elements from YOUR perspective.")
-        # --- End EDITED Instructions Section ---
-
         # Add the current user input
-        context_parts.append(f"## Current Input (My Action/Dialogue):")
-        context_parts.append(f"{user_input}")
-        context_parts.append(f"\nYour response AS Holmes (5-8 sentences of narrative using 'I'):")
+        context_parts.append("## Current Input (My Action/Dialogue):")
+        context_parts.append(user_input)
+        context_parts.append("\nYour response AS Holmes (5-8 sentences of narrative using 'I'):")
 
         full_prompt = "\n".join(context_parts)
 
-        # Add redirection logic if input is irrelevant
-        # This check is done *before* sending to the main LLM
-        # (Assuming check_input_relevance has already been called in process_user_input)
-        # -> Logic moved to process_user_input
-
         return full_prompt
 
 
-    def generate_api_response(self, prompt, model=None):
-        """Generate a response using a single message approach"""
-        if model is None:
-            model = self.default_model
-
+    def _log_prompt(self, prompt, model):
+        """Log the prompt sent to the model (debug level)"""
+        if not logging.getLogger().isEnabledFor(logging.DEBUG):
+            return # Skip splitting/joining the prompt when debug output is off
         logging.debug(f"--- Sending Prompt to Model {model} ---")
         # Log only first/last few lines for brevity if very long
         prompt_lines = prompt.split('\n')
@@ -266,11 +556,34 @@ class SherlockLLMHandler:
         logging.debug("--------------------------------------")
 
 
+    def _cache_key(self, prompt, model):
+        """Response cache key for a narration request"""
+        return sherlock_llm_cache.make_key(model, prompt, NARRATION_TEMPERATURE, NARRATION_MAX_TOKENS, PROMPT_VERSION)
+
+
+    def generate_api_response(self, prompt, model=None, use_cache=False):
+        """
+        Generate a response using a single message approach.
+        With use_cache, an identical earlier request is answered from the on-disk response cache.
+        """
+        if model is None:
+            model = self.default_model
+
+        self._log_prompt(prompt, model)
+
+        cache_key = None
+        if use_cache:
+            cache_key = self._cache_key(prompt, model)
+            cached = sherlock_llm_cache.get(cache_key)
+            if cached is not None:
+                logging.info(f"LLM response cache hit ({model}).")
+                return cached
+
         try:
             response = self.client.chat.completions.create(
                 model=model,
-                max_tokens=800, # Increased slightly for potentially richer narrative
-                temperature=0.75, # Slightly higher temp for more creativity
+                max_tokens=NARRATION_MAX_TOKENS,
+                temperature=NARRATION_TEMPERATURE,
                 top_p=0.9,
                 # Nebius specific params if needed, otherwise handled by client
                 # extra_body={"top_k": 50},
@@ -291,28 +604,150 @@ class SherlockLLMHandler:
             else:
                 result_text = content or ""
 
-            logging.debug(f"--- Received Response ---")
-            logging.debug(result_text)
-            logging.debug("-----------------------")
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug(f"--- Received Response ---")
+                logging.debug(result_text)
+                logging.debug("-----------------------")
 
-            return result_text.strip()
+            result_text = result_text.strip()
+            if cache_key and result_text:
+                sherlock_llm_cache.put(cache_key, result_text)
+            return result_text
 
         except Exception as e:
             logging.error(f"Error calling LLM ({model}): {e}", exc_info=True)
             # Provide a more in-character error message
-            return """Blast! A most peculiar interference clouds my thoughts. Perhaps the fog is thicker than I imagined, or maybe it's simply a failure of my own deductive faculties at this moment. I should refocus. What was the immediate matter at hand?
-
-TIME UPDATE: A moment passes as I collect my thoughts."""
+            return API_ERROR_RESPONSE
 
 
-    # --- EDITED generate_new_case Method ---
-    def generate_new_case(self, genre, model=None):
-        """Generate a new Sherlock Holmes case, written in first person."""
+    def generate_api_response_stream(self, prompt, model=None, use_cache=False):
+        """Generate a response like generate_api_response, yielding text chunks as they arrive"""
         if model is None:
             model = self.default_model
 
-        # Create a detailed prompt for case generation emphasizing first person
+        self._log_prompt(prompt, model)
+
+        cache_key = None
+        if use_cache:
+            cache_key = self._cache_key(prompt, model)
+            cached = sherlock_llm_cache.get(cache_key)
+            if cached is not None:
+                logging.info(f"LLM response cache hit ({model}).")
+                yield cached
+                return
+
+        received = []
+        try:
+            stream = self.client.chat.completions.create(
+                model=model,
+                max_tokens=NARRATION_MAX_TOKENS,
+                temperature=NARRATION_TEMPERATURE,
+                top_p=0.9,
+                stream=True,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [{"type": "text", "text": prompt}]
+                    }
+                ]
+            )
+            try:
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        received.append(delta)
+                        yield delta
+            except GeneratorExit:
+                # Abandoned by the caller (e.g. a discarded speculative turn): release the connection
+                stream.close()
+                raise
+
+            result_text = "".join(received)
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("--- Received Response (streamed) ---")
+                logging.debug(result_text)
+                logging.debug("-----------------------")
+
+            if cache_key and result_text.strip():
+                sherlock_llm_cache.put(cache_key, result_text.strip())
+
+        except Exception as e:
+            logging.error(f"Error streaming from LLM ({model}): {e}", exc_info=True)
+            # Provide a more in-character error message, after whatever already arrived
+            yield ("\n\n" if received else "") + API_ERROR_RESPONSE
+
+
+    def summarize(self, messages, model=None, use_cache=False, previous_summary=None):
+        """
+        Summarize older conversation messages (continuing previous_summary, if any) into a short recap.
+        Returns None if the summary could not be generated.
+        """
+        transcript = []
+        if previous_summary:
+            transcript.append(f"Earlier Summary:\n{previous_summary}")
+        for msg in messages:
+            role = msg.get("role")
+            content = msg.get("content", "")
+            if role == "user":
+                transcript.append(f"My Action/Thought: {content}")
+            elif role == "assistant":
+                transcript.append(f"Narrative/Outcome:\n{content}")
+        if not transcript:
+            return None
+
         prompt = f"""
+# ROLE: You ARE Sherlock Holmes, reviewing your case notes.
+# TASK: Summarize the events below in YOUR first-person perspective, in at most 10 sentences.
+Keep every clue, suspect, location, item and deduction that may matter for solving the case. Do not invent anything new.
+
+## Events:
+{chr(10).join(transcript)}
+
+## Summary (first person, using 'I'):
+"""
+        summary = self.generate_api_response(prompt, model, use_cache=use_cache)
+        if not summary or "Blast! A most peculiar interference" in summary:
+            logging.warning("Conversation summarization failed; keeping the full history for now.")
+            return None
+        return summary
+
+
+    def needs_compaction(self, game_state):
+        """True if compact_conversation would summarize (and thus make an API call) now"""
+        # The -1 skips the system prompt at conversation[0]
+        return len(game_state.get('conversation', [])) - 1 > 2 * MAX_RECENT_TURNS + 2 * SUMMARY_BATCH_TURNS
+
+
+    def compact_conversation(self, game_state):
+        """
+        Fold the oldest turns of the conversation into game_state['case_so_far'], keeping the
+        system prompt and the last MAX_RECENT_TURNS turns verbatim. The conversation stays a plain
+        list, so saves and history slicing are unaffected. Returns True if the conversation was compacted.
+        """
+        if not self.needs_compaction(game_state):
+            return False
+        conversation = game_state['conversation']
+        keep = 2 * MAX_RECENT_TURNS
+
+        summary = self.summarize(conversation[1:-keep], game_state.get('model'),
+                                 use_cache=game_state.get('_llm_cache_enabled', True),
+                                 previous_summary=game_state.get('case_so_far'))
+        if not summary:
+            return False
+
+        game_state['case_so_far'] = summary
+        del conversation[1:-keep]
+        logging.info(f"Compacted conversation history for game {game_state.get('game_id')}.")
+        return True
+
+
+    # --- EDITED generate_new_case Method ---
+    def _new_case_prompt(self, genre):
+        """Build the case generation prompt for a genre."""
+        # Create a detailed prompt for case generation emphasizing first person
+        return f"""
 # ROLE: You ARE Sherlock Holmes.
 # TASK: Narrate the beginning of a new case from YOUR first-person perspective.
 # CRITICAL INSTRUCTION: ALL narrative MUST use "I", "me", "my", "myself". NEVER use "Holmes", "he", "him", "his" to refer to yourself (the narrator). You are telling the story as it happens to YOU.
@@ -347,29 +782,43 @@ Create an engaging opening scene for this {genre} case, written entirely in YOUR
 
 REMEMBER: You ARE Sherlock Holmes. Write ONLY in the first person ("I", "my"). Do NOT describe Holmes externally.
 """
+
+    def generate_new_case(self, genre, model=None):
+        """Generate a new Sherlock Holmes case, written in first person."""
         # Note: The system prompt passed initially to the handler isn't directly used here,
         # this specific prompt takes precedence for case generation.
-        return self.generate_api_response(prompt, model)
+        return self.generate_api_response(self._new_case_prompt(genre), model)
+
+    def generate_new_case_stream(self, genre, model=None):
+        """Generate a new case like generate_new_case, yielding text chunks as they arrive"""
+        return self.generate_api_response_stream(self._new_case_prompt(genre), model)
     # --- End EDITED generate_new_case Method ---
 
 
-    def process_user_input(self, user_input, game_state):
-        """Process user input and generate a response that maintains story quality"""
+    def _prepare_turn(self, user_input, game_state):
+        """
+        Start the relevance check, record the user input and build the prompts for this turn.
+        Returns (model, prompt, redirect_prompt, is_relevant, relevance_future). If the relevance
+        check needs the API, is_relevant is None and relevance_future resolves to the API verdict.
+        """
         model = game_state.get('model', self.default_model)
-        genre = game_state.get('genre', 'mystery').upper() # Get genre for system prompt
 
-        # Prepare the specific system prompt for this game's genre
-        # Ensure the template exists before replacing
-        system_prompt = self.system_prompt_template
-        if system_prompt:
-             system_prompt = system_prompt.replace("{GENRE}", genre)
+        # Use the system prompt rendered for this game at creation time (identical on every turn).
+        # It is the first conversation message, which compaction never removes.
+        conversation = game_state['conversation']
+        if conversation and conversation[0].get('role') == 'system':
+            system_prompt = conversation[0]['content']
         else:
-             logging.error("System prompt template is missing!")
-             system_prompt = f"# Sherlock Holmes Adventure ({genre})\nYou ARE Sherlock Holmes. Respond in first person." # Basic fallback
-
+            system_prompt = self.render_system_prompt(game_state.get('genre', 'mystery'))
 
         # --- Relevance Check ---
-        is_relevant = self.check_input_relevance(user_input, game_state)
+        # Answered locally when possible, otherwise the API check runs while the narration is requested
+        is_relevant = self._quick_relevance(user_input, game_state)
+        relevance_future = None
+        if is_relevant is None:
+            relevance_future = self._executor.submit(
+                self._api_relevance, user_input, self._relevance_prompt(user_input, game_state)
+            )
 
         # Add user input to conversation history *before* creating context
         game_state['conversation'].append({"role": "user", "content": user_input})
@@ -377,40 +826,40 @@ REMEMBER: You ARE Sherlock Holmes. Write ONLY in the first person ("I", "my"). D
         # Create rich context
         rich_context = self.create_rich_context(game_state, user_input)
 
+        # Generate response using the main context
+        # We need to combine the system prompt with the user's detailed context prompt
+        # For Nebius format, include system prompt implicitly or as part of user message
+        # Let's prepend the core system instruction to the user prompt. Keeping the unchanging
+        # system prompt at the very start gives every call of this game an identical prefix,
+        # which the provider's automatic prefix caching can reuse instead of re-encoding it.
+        prompt = f"{system_prompt}\n\n{rich_context}"
+
         # If input is not relevant, add special instructions *to the rich context*
-        response_text = ""
+        # Generate a response focused on redirection
+        redirect_prompt = rich_context + "\n\nNOTE TO SELF (AS HOLMES): My current line of thought seems tangential to the case. I must gently steer myself back towards the central mystery without revealing this internal correction. How can I subtly return to the pertinent facts?"
+
+        return model, prompt, redirect_prompt, is_relevant, relevance_future
+
+
+    def _await_relevance(self, user_input, game_state, relevance_future):
+        """Wait for a speculative relevance check and record its verdict"""
+        is_relevant = self._store_relevance(user_input, game_state, relevance_future.result())
         if not is_relevant:
             logging.info(f"Adding redirection instructions for irrelevant input: '{user_input}'")
-            redirection_prompt = rich_context + "\n\nNOTE TO SELF (AS HOLMES): My current line of thought seems tangential to the case. I must gently steer myself back towards the central mystery without revealing this internal correction. How can I subtly return to the pertinent facts?"
-            # Generate a response focused on redirection
-            response_text = self.generate_api_response(redirection_prompt, model)
-        else:
-             # Generate response using the main context
-             # We need to combine the system prompt with the user's detailed context prompt
-             # For Nebius format, include system prompt implicitly or as part of user message
-             # Let's prepend the core system instruction to the user prompt:
-             final_prompt = f"{system_prompt}\n\n{rich_context}"
-             response_text = self.generate_api_response(final_prompt, model)
+        return is_relevant
 
+
+    def _finalize_turn(self, user_input, game_state, response_text, is_relevant):
+        """Record the response and update case elements / solved status for a finished turn"""
         # Add LLM response to conversation history
         game_state['conversation'].append({"role": "assistant", "content": response_text})
 
         # Extract and store key elements *only if input was relevant*
         # and the response wasn't just a redirection/error.
         if is_relevant and "Blast! A most peculiar interference" not in response_text:
-            if 'case_elements' not in game_state:
-                 game_state['case_elements'] = {'clues': [], 'suspects': [], 'locations': [], 'items': []}
-
-            new_elements = extract_key_elements(response_text)
-            for category in ['clues', 'suspects', 'locations', 'items']:
-                # Add only genuinely new elements
-                current_elements = set(game_state['case_elements'].get(category, []))
-                added_count = 0
-                for element in new_elements.get(category, []):
-                    if element not in current_elements:
-                        game_state['case_elements'][category].append(element)
-                        current_elements.add(element) # Update set for check within loop
-                        added_count += 1
+            # Add only genuinely new elements
+            added_counts = add_case_elements(game_state, extract_key_elements(response_text))
+            for category, added_count in added_counts.items():
                 if added_count > 0:
                      logging.info(f"Added {added_count} new element(s) to {category}.")
 
@@ -425,10 +874,61 @@ REMEMBER: You ARE Sherlock Holmes. Write ONLY in the first person ("I", "my"). D
              game_state['case_solved'] = game_state.get('case_solved', False)
 
 
-        # Update last_updated timestamp
-        game_state['last_updated'] = datetime.now().isoformat()
+        # last_updated is stamped by save_game_state when the state is actually written
+
+        return game_state
 
-        return response_text, game_state
+
+    def process_user_input(self, user_input, game_state):
+        """Process user input and generate a response that maintains story quality"""
+        turn = self.process_user_input_stream(user_input, game_state)
+        response_text = "".join(turn).strip()
+        return response_text, self.finalize(turn, response_text)
+
+
+    def process_user_input_stream(self, user_input, game_state):
+        """
+        Streaming variant of process_user_input. Returns a StreamedTurn to iterate for the response
+        text; once it is consumed, call finalize(turn, full_text) with the joined chunks.
+        """
+        turn = StreamedTurn(user_input, game_state)
+        turn._chunks = self._stream_turn(turn)
+        return turn
+
+
+    def _stream_turn(self, turn):
+        """Yield the response chunks of a turn, setting turn.is_relevant before the first one"""
+        user_input, game_state = turn.user_input, turn.game_state
+        model, prompt, redirect_prompt, is_relevant, relevance_future = self._prepare_turn(user_input, game_state)
+        use_cache = game_state.get('_llm_cache_enabled', True)
+        if relevance_future is None:
+            if not is_relevant:
+                logging.info(f"Adding redirection instructions for irrelevant input: '{user_input}'")
+            turn.is_relevant = is_relevant
+            yield from self.generate_api_response_stream(prompt if is_relevant else redirect_prompt, model, use_cache=use_cache)
+            return
+
+        # Speculatively open the narration stream and wait for its first chunk on a worker
+        # while the relevance check is still running
+        narration = self.generate_api_response_stream(prompt, model, use_cache=use_cache)
+        first_chunk = self._executor.submit(next, narration, None)
+        is_relevant = turn.is_relevant = self._await_relevance(user_input, game_state, relevance_future)
+        if is_relevant:
+            chunk = first_chunk.result()
+            if chunk is not None:
+                yield chunk
+                yield from narration
+        else:
+            # Drop the narration stream once its first chunk is in (closing it while running is not allowed)
+            first_chunk.add_done_callback(lambda _: narration.close())
+            yield from self.generate_api_response_stream(redirect_prompt, model, use_cache=use_cache)
+
+
+    def finalize(self, turn, response_text):
+        """Finish a StreamedTurn whose response has been streamed. Returns the updated game state."""
+        if turn.is_relevant is None:
+            raise ValueError("finalize() called before the turn's response was streamed")
+        return self._finalize_turn(turn.user_input, turn.game_state, response_text.strip(), turn.is_relevant)
 
 
     def check_win_condition(self, user_input, response, game_state):
@@ -437,29 +937,17 @@ REMEMBER: You ARE Sherlock Holmes. Write ONLY in the first person ("I", "my"). D
         if game_state.get('case_solved', False):
             return True
 
-        # More specific phrases indicating the player is attempting to solve
-        solving_phrases = [
-            "i believe the culprit is", "the killer must be", "my conclusion is",
-            "i accuse", "the solution involves", "it was", "so the murderer is",
-            "the answer is", "i've solved it"
-        ]
-        user_is_solving = any(phrase in user_input.lower() for phrase in solving_phrases)
-
-        # More specific confirmation phrases from the LLM (as Holmes)
-        confirmation_phrases = [
-            "indeed, that is correct", "precisely my deduction", "you have unravelled it",
-            "an astute conclusion", "the case is closed", "brilliant deduction",
-            "you've pieced it together", "elementary, once reasoned out", "correct",
-            "exactly so", "congratulations are in order"
-        ]
+        # Only look at the response when the player is actually attempting to solve
+        if not _SOLVE_RE.search(user_input):
+            return False
+
         # Check response for confirmation *and* ensure it's not denying
-        denial_phrases = ["incorrect", "not quite", "alas, no", "mistaken", "i think not"]
-        llm_confirms = any(phrase in response.lower() for phrase in confirmation_phrases)
-        llm_denies = any(phrase in response.lower() for phrase in denial_phrases)
+        llm_confirms = _CONFIRM_RE.search(response) is not None
+        llm_denies = _DENY_RE.search(response) is not None
 
 
         # Win condition: Player attempts to solve, LLM confirms, and LLM does not deny.
-        if user_is_solving and llm_confirms and not llm_denies:
+        if llm_confirms and not llm_denies:
              # Double-check: ensure the confirmation isn't immediately followed by a contradiction.
              # This is harder to parse perfectly, but the check above is a good start.
              return True